@@ -1,8 +1,13 @@
 import streamlit as st
 from google.cloud import bigquery
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow.compute as pc
 import os
+import functools
+from gsc_data import downcast_gsc_frame, load_gsc_csv
 
 # Page Configuration
 st.set_page_config(
@@ -46,18 +51,13 @@ st.divider()
 st.sidebar.header("Configuration")
 
 # Date Range
+# Defaults to the trailing year and stops at today (UTC), so no future days are queried
+today = pd.Timestamp.now(tz='UTC').date()
 date_range = st.sidebar.date_input(
     "Select Date Range",
-    value=(pd.to_datetime("2024-01-01"), pd.to_datetime("2026-02-01")),
+    value=(today - pd.Timedelta(days=365), today),
     min_value=pd.to_datetime("2023-01-01"),
-    max_value=pd.to_datetime("2026-12-31")
-)
-
-# Granularity Selector
-granularity = st.sidebar.selectbox(
-    "Time Granularity",
-    options=["Week", "Month"],
-    index=0
+    max_value=today
 )
 
 # Mapping options to SQL parts
@@ -65,12 +65,19 @@ time_trunc_map = {
     "Week": "WEEK",
     "Month": "MONTH"
 }
-trunc_val = time_trunc_map[granularity]
+
+# Granularity Selector
+# Rendered inside each BigQuery section's fragment, so changing it reruns only that section
+def granularity_selector(key):
+    return st.selectbox(
+        "Time Granularity",
+        options=["Week", "Month"],
+        index=0,
+        key=key
+    )
 
 if len(date_range) == 2:
     start_date, end_date = date_range
-    start_date_str = start_date.strftime('%Y%m%d')
-    end_date_str = end_date.strftime('%Y%m%d')
 else:
     st.error("Please select a valid start and end date.")
     st.stop()
@@ -99,243 +106,323 @@ def get_bigquery_client():
 client = get_bigquery_client()
 DATASET = "analytics_306941895"
 
-# --- Section 1: Search Volume ---
-st.header("1. Search Volume Trends")
-st.write(f"Trend of internal site searches for \"pulex bucket\" aggregated by **{granularity}**.")
-
-@st.cache_data(ttl=3600)
-def load_search_data(start, end, time_trunc):
-    sql_search = f"""
+def date_range_job_config(start, end):
+    # Dates are bound as parameters so the SQL text stays stable and repeat runs hit BigQuery's result cache
+    return bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("start", "DATE", start),
+            bigquery.ScalarQueryParameter("end", "DATE", end),
+        ],
+        use_query_cache=True
+    )
+
+# Searches and product views come back from one query over the daily rollup
+# maintained by sql/pulex_bucket_daily.sql, tagged by `kind`.
+# Dates are query parameters, so the SQL text only varies with the granularity;
+# a plain in-process memo avoids st.cache_data's hashing and pickling per call.
+@functools.lru_cache(maxsize=None)
+def build_bigquery_sql(time_trunc):
+    return f"""
         SELECT
-            DATE_TRUNC(PARSE_DATE('%Y%m%d', event_date), {time_trunc}) as date_period,
-            COUNT(*) as search_count
+            kind,
+            DATE_TRUNC(d, {time_trunc}) as date_period,
+            item_name,
+            SUM(c) as total
         FROM
-            `analytics-473719.{DATASET}.events_*`
+            `analytics-473719.{DATASET}.pulex_bucket_daily`
         WHERE
-            event_name = 'view_search_results'
-            AND LOWER((SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'search_term')) LIKE '%pulex bucket%'
-            AND _TABLE_SUFFIX BETWEEN '{start}' AND '{end}'
-        GROUP BY
-            date_period
-        ORDER BY
-            date_period ASC
+            d BETWEEN @start AND @end
+            AND (kind = 'search' OR (kind = 'view' AND item_color IS NOT NULL))
+        GROUP BY 1, 2, 3
+        ORDER BY 2 ASC, 4 DESC
     """
-    df = client.query(sql_search).to_dataframe()
-    df['date_period'] = pd.to_datetime(df['date_period'])
-    return df
-
-with st.spinner('Loading search volume data...'):
-    try:
-        df_search = load_search_data(start_date_str, end_date_str, trunc_val)
-        
-        if not df_search.empty:
-            fig1 = px.line(
-                df_search, 
-                x='date_period', 
-                y='search_count',
-                title=f'Search Volume ({granularity}ly)',
-                labels={'date_period': 'Date', 'search_count': 'Searches'},
-                markers=True,
-                line_shape='spline' # Makes the line smooth
-            )
-            fig1.update_traces(line_color='#636EFA', hovertemplate='<b>Date:</b> %{x|%b %d, %Y}<br><b>Searches:</b> %{y}')
-            fig1.update_layout(hovermode="x unified")
-            st.plotly_chart(fig1, use_container_width=True)
-            
-            with st.expander("View Raw Search Data"):
-                st.dataframe(df_search)
-        else:
-            st.warning("No search data found for this date range.")
 
-    except Exception as e:
-        st.error(f"Error loading search data: {e}")
+def submit_bigquery_query(start, end, time_trunc):
+    return client.query(build_bigquery_sql(time_trunc), job_config=date_range_job_config(start, end))
+
+def fetch_query_results(job):
+    # Download through the BigQuery Storage Read API instead of paging tabledata.list,
+    # keeping the Arrow table so charts read its columns without a pandas round-trip
+    return job.result().to_arrow(create_bqstorage_client=True)
+
+def split_bigquery_results(table):
+    is_search = pc.equal(table.column('kind'), 'search')
+    search_table = (
+        table.filter(is_search)
+        .select(['date_period', 'total'])
+        .rename_columns(['date_period', 'search_count'])
+    )
+    items_table = (
+        table.filter(pc.invert(is_search))
+        .select(['date_period', 'item_name', 'total'])
+        .rename_columns(['date_period', 'item_name', 'views'])
+        .sort_by([('item_name', 'ascending'), ('date_period', 'ascending')])
+    )
+    # The handful of variant names repeat on every row, so store them dictionary-encoded.
+    # Sorting happens first because Arrow cannot sort tables on dictionary columns.
+    items_table = items_table.set_column(
+        items_table.schema.get_field_index('item_name'),
+        'item_name',
+        items_table.column('item_name').dictionary_encode()
+    )
+    return search_table, items_table
 
-st.divider()
+@st.cache_data(ttl=3600)
+def load_bigquery_data(start, end, time_trunc):
+    job = submit_bigquery_query(start, end, time_trunc)
+    return split_bigquery_results(fetch_query_results(job))
 
-# --- Section 2: Product Views ---
-st.header("2. Product View Analysis")
-st.write(f"Tracking when users **click** to view specific \"Pulex Bucket\" product pages. Unlike search volume, this represents direct interest in a specific item.")
+# --- Section 1: Search Volume ---
+@st.fragment
+def search_section(start, end):
+    st.header("1. Search Volume Trends")
+    granularity = granularity_selector("search_granularity")
+    st.write(f"Trend of internal site searches for \"pulex bucket\" aggregated by **{granularity}**.")
 
-@st.cache_data(ttl=3600)
-def load_product_data(start, end, time_trunc):
-    sql_items = f"""
-        SELECT
-            DATE_TRUNC(PARSE_DATE('%Y%m%d', event_date), {time_trunc}) as date_period,
-            item.item_name,
-            COUNT(*) as views
-        FROM
-            `analytics-473719.{DATASET}.events_*`,
-            UNNEST(items) as item
-        WHERE
-            event_name = 'view_item'
-            AND LOWER(item.item_name) LIKE '%pulex bucket%'
-            AND (
-                item.item_name LIKE '%Red%'
-                OR item.item_name LIKE '%Blue%'
-                OR item.item_name LIKE '%Green%'
-                OR item.item_name LIKE '%Gray%'
-            )
-            AND _TABLE_SUFFIX BETWEEN '{start}' AND '{end}'
-        GROUP BY 1, 2
-        ORDER BY 1 ASC, 3 DESC
-    """
-    df = client.query(sql_items).to_dataframe()
-    df['date_period'] = pd.to_datetime(df['date_period'])
-    return df
+    with st.spinner('Loading search volume data...'):
+        try:
+            search_table, _ = load_bigquery_data(start, end, time_trunc_map[granularity])
+        except Exception as e:
+            st.error(f"Error loading search data: {e}")
+            return
+
+    if search_table.num_rows > 0:
+        fig1 = go.Figure(go.Scatter(
+            x=search_table.column('date_period').to_numpy(),
+            y=search_table.column('search_count').to_numpy(),
+            name='Searches',
+            mode='lines+markers',
+            line_color='#636EFA',
+            hovertemplate='<b>Date:</b> %{x|%b %d, %Y}<br><b>Searches:</b> %{y}'
+        ))
+        fig1.update_layout(
+            title=f'Search Volume ({granularity}ly)',
+            xaxis_title='Date',
+            yaxis_title='Searches',
+            hovermode="x unified"
+        )
+        st.plotly_chart(fig1, use_container_width=True)
+
+        with st.expander("View Raw Search Data"):
+            st.dataframe(search_table)
+    else:
+        st.warning("No search data found for this date range.")
 
-with st.spinner('Loading product view data...'):
-    try:
-        df_items = load_product_data(start_date_str, end_date_str, trunc_val)
-        
-        if not df_items.empty:
-            fig2 = px.line(
-                df_items, 
-                x='date_period', 
-                y='views', 
-                color='item_name',
-                title=f'Product Views by Color ({granularity}ly)',
-                labels={'date_period': 'Date', 'views': 'Page Views', 'item_name': 'Product Variant'},
-                markers=True
-            )
-            fig2.update_layout(hovermode="x unified")
-            st.plotly_chart(fig2, use_container_width=True)
-            
-            with st.expander("View Raw Product Data"):
-                st.dataframe(df_items)
-        else:
-            st.warning("No product view data found for this date range.")
+# --- Section 2: Product Views ---
+@st.fragment
+def product_section(start, end):
+    st.header("2. Product View Analysis")
+    granularity = granularity_selector("product_granularity")
+    st.write(f"Tracking when users **click** to view specific \"Pulex Bucket\" product pages. Unlike search volume, this represents direct interest in a specific item.")
 
-    except Exception as e:
-        st.error(f"Error loading product data: {e}")
+    with st.spinner('Loading product view data...'):
+        try:
+            _, items_table = load_bigquery_data(start, end, time_trunc_map[granularity])
+        except Exception as e:
+            st.error(f"Error loading product data: {e}")
+            return
+
+    if items_table.num_rows > 0:
+        fig2 = go.Figure()
+        # split_bigquery_results sorts by variant, so each variant's rows are one contiguous slice
+        offset = 0
+        for entry in pc.value_counts(items_table.column('item_name')):
+            count = entry['counts'].as_py()
+            variant = items_table.slice(offset, count)
+            offset += count
+            fig2.add_trace(go.Scatter(
+                x=variant.column('date_period').to_numpy(),
+                y=variant.column('views').to_numpy(),
+                name=entry['values'].as_py(),
+                mode='lines+markers'
+            ))
+        fig2.update_layout(
+            title=f'Product Views by Color ({granularity}ly)',
+            xaxis_title='Date',
+            yaxis_title='Page Views',
+            legend_title_text='Product Variant',
+            hovermode="x unified"
+        )
+        st.plotly_chart(fig2, use_container_width=True)
+
+        with st.expander("View Raw Product Data"):
+            st.dataframe(items_table)
+    else:
+        st.warning("No product view data found for this date range.")
 
 # --- Section 3: Google Search Console (GSC) Data ---
-st.divider()
-st.header("3. Google Search Console Analysis")
-st.write("Analysis of organic Google Search performance from local export data.")
-
 # Paths to local data (Relatively referenced for deployment)
 # Using generic paths that work in both local (if cwd is correct) and cloud environments
 PATH_DIRECT = os.path.join(os.path.dirname(__file__), "Pulex-Bucket-Direct")
 PATH_COLLECTION = os.path.join(os.path.dirname(__file__), "Bucket-Collection")
 
-@st.cache_data(ttl=3600)
-def load_gsc_data(directory_path, label):
+# CTR is kept in percent units once parsed, so it is formatted with a trailing "%"
+GSC_TABLE_CONFIG = {
+    'CTR': st.column_config.NumberColumn(format="%.2f%%"),
+    'Position': st.column_config.NumberColumn(format="%.2f")
+}
+
+GSC_SOURCES = ((PATH_DIRECT, "Direct"), (PATH_COLLECTION, "Collection"))
+
+def gsc_fingerprint(sources):
+    # Name, mtime and size of every export file; only changes when the data on disk does
+    fingerprint = []
+    for directory_path, _ in sources:
+        for entry in sorted(os.scandir(directory_path), key=lambda e: e.name):
+            if entry.is_file():
+                stat = entry.stat()
+                fingerprint.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+# No TTL: `fingerprint` is part of the cache key, so edited exports invalidate the entry.
+# Only the latest fingerprint can ever be hit, so keep a single entry.
+@st.cache_data(max_entries=1)
+def load_gsc_data(sources, fingerprint):
     data = {}
     
-    def safe_load(filename):
+    def safe_load(directory_path, filename):
         path = os.path.join(directory_path, filename)
+        # Prefer the typed Parquet copy written by convert_gsc_to_parquet.py,
+        # unless a newer CSV export has been dropped in since it was converted
+        parquet_path = os.path.splitext(path)[0] + '.parquet'
+        if os.path.exists(parquet_path) and (
+            not os.path.exists(path) or os.path.getmtime(parquet_path) >= os.path.getmtime(path)
+        ):
+            return pd.read_parquet(parquet_path, engine='pyarrow')
         if os.path.exists(path):
-            try:
-                df = pd.read_csv(path, encoding='utf-8-sig')
-            except Exception:
-                # Fallback to latin1 if utf-8 fails
-                df = pd.read_csv(path, encoding='latin1')
-            df.columns = df.columns.str.strip()
-            df['Source'] = label
-            return df
+            return load_gsc_csv(path)
         return None
 
-    # Load Chart.csv
-    df_chart = safe_load('Chart.csv')
-    if df_chart is not None:
-        if 'Date' in df_chart.columns:
-            df_chart['Date'] = pd.to_datetime(df_chart['Date'])
-        data['chart'] = df_chart
-        
-    # Load Queries and Pages
-    data['queries'] = safe_load('Queries.csv')
-    data['pages'] = safe_load('Pages.csv')
+    for key, filename in (('chart', 'Chart.csv'), ('queries', 'Queries.csv'), ('pages', 'Pages.csv')):
+        frames = [safe_load(directory_path, filename) for directory_path, _ in sources]
+        # Only combine when every source has the export, as before
+        if any(df is None for df in frames):
+            data[key] = pd.DataFrame()
+            continue
+
+        # Concatenate all sources once and tag rows afterwards, instead of copying per label
+        labels = [label for _, label in sources]
+        df = downcast_gsc_frame(pd.concat(frames, ignore_index=True))
+        df['Source'] = pd.Categorical.from_codes(
+            np.repeat(np.arange(len(frames)), [len(frame) for frame in frames]),
+            categories=labels
+        )
+        if 'Date' in df.columns:
+            df['Date'] = pd.to_datetime(df['Date'])
+        for col in ('Top queries', 'Top pages'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        data[key] = df
+
+    # Top 10 by clicks per source, computed once here rather than sorted on every rerun
+    for key, name_col in (('queries', 'Top queries'), ('pages', 'Top pages')):
+        df = data[key]
+        data[f'{key}_top'] = {}
+        if not df.empty:
+            for _, label in sources:
+                data[f'{key}_top'][label] = (
+                    df[df['Source'] == label]
+                    .nlargest(10, 'Clicks')[[name_col, 'Clicks', 'Impressions', 'CTR', 'Position']]
+                )
         
     return data
 
-if os.path.exists(PATH_DIRECT) and os.path.exists(PATH_COLLECTION):
-    with st.spinner('Loading GSC data...'):
-        # Load Data
-        data_direct = load_gsc_data(PATH_DIRECT, "Direct")
-        data_collection = load_gsc_data(PATH_COLLECTION, "Collection")
+# Takes no inputs, so granularity changes in the other fragments never rerun it
+@st.fragment
+def gsc_section():
+    st.header("3. Google Search Console Analysis")
+    st.write("Analysis of organic Google Search performance from local export data.")
+
+    if os.path.exists(PATH_DIRECT) and os.path.exists(PATH_COLLECTION):
+        with st.spinner('Loading GSC data...'):
+            # Load Data
+            data_gsc = load_gsc_data(GSC_SOURCES, gsc_fingerprint(GSC_SOURCES))
+            df_chart_all = data_gsc['chart']
+            df_queries_all = data_gsc['queries']
+            df_pages_all = data_gsc['pages']
+
+            # Visualizations
+            if not df_chart_all.empty:
+                # Clicks Trend
+                fig_gsc_clicks = px.line(
+                    df_chart_all, x='Date', y='Clicks', color='Source', 
+                    title='GSC Clicks Trend', markers=True
+                )
+                fig_gsc_clicks.update_layout(hovermode="x unified")
+                st.plotly_chart(fig_gsc_clicks, use_container_width=True)
+        
+                # Impressions Trend
+                fig_gsc_imps = px.line(
+                    df_chart_all, x='Date', y='Impressions', color='Source', 
+                    title='GSC Impressions Trend', markers=True
+                )
+                fig_gsc_imps.update_layout(hovermode="x unified")
+                st.plotly_chart(fig_gsc_imps, use_container_width=True)
+
+            # Top Queries Table
+            if not df_queries_all.empty:
+                st.subheader("Top Queries (by Clicks)")
+                col_q1, col_q2 = st.columns(2)
         
-        # Combine Chart Data
-        df_chart_all = pd.DataFrame()
-        if data_direct.get('chart') is not None and data_collection.get('chart') is not None:
-            df_chart_all = pd.concat([data_direct['chart'], data_collection['chart']], ignore_index=True)
+                with col_q1:
+                    st.caption("Source: Direct")
+                    st.dataframe(
+                        data_gsc['queries_top']['Direct'],
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config=GSC_TABLE_CONFIG
+                    )
             
-        # Combine Queries Data
-        df_queries_all = pd.DataFrame()
-        if data_direct.get('queries') is not None and data_collection.get('queries') is not None:
-            df_queries_all = pd.concat([data_direct['queries'], data_collection['queries']], ignore_index=True)
-
-        # Combine Pages Data
-        df_pages_all = pd.DataFrame()
-        if data_direct.get('pages') is not None and data_collection.get('pages') is not None:
-            df_pages_all = pd.concat([data_direct['pages'], data_collection['pages']], ignore_index=True)
-
-        # Visualizations
-        if not df_chart_all.empty:
-            # Clicks Trend
-            fig_gsc_clicks = px.line(
-                df_chart_all, x='Date', y='Clicks', color='Source', 
-                title='GSC Clicks Trend', markers=True
-            )
-            fig_gsc_clicks.update_layout(hovermode="x unified")
-            st.plotly_chart(fig_gsc_clicks, use_container_width=True)
+                with col_q2:
+                    st.caption("Source: Collection")
+                    st.dataframe(
+                        data_gsc['queries_top']['Collection'],
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config=GSC_TABLE_CONFIG
+                    )
+
+            # Top Pages Table
+            if not df_pages_all.empty:
+                st.subheader("Top Landing Pages (by Clicks)")
+                col_p1, col_p2 = st.columns(2)
+        
+                with col_p1:
+                    st.caption("Source: Direct")
+                    st.dataframe(
+                        data_gsc['pages_top']['Direct'],
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config=GSC_TABLE_CONFIG
+                    )
             
-            # Impressions Trend
-            fig_gsc_imps = px.line(
-                df_chart_all, x='Date', y='Impressions', color='Source', 
-                title='GSC Impressions Trend', markers=True
-            )
-            fig_gsc_imps.update_layout(hovermode="x unified")
-            st.plotly_chart(fig_gsc_imps, use_container_width=True)
+                with col_p2:
+                    st.caption("Source: Collection")
+                    st.dataframe(
+                        data_gsc['pages_top']['Collection'],
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config=GSC_TABLE_CONFIG
+                    )
+
+    else:
+        st.warning(f"GSC Data directories not found. Expected at: `{PATH_DIRECT}` and `{PATH_COLLECTION}`")
+
+# Tabs track the selected section, so only the visible one queries and renders
+tab_search, tab_products, tab_gsc = st.tabs(
+    ["1. Search Volume", "2. Product Views", "3. Google Search Console"],
+    on_change="rerun",
+    key="report_section"
+)
 
-        # Top Queries Table
-        if not df_queries_all.empty:
-            st.subheader("Top Queries (by Clicks)")
-            col_q1, col_q2 = st.columns(2)
-            
-            with col_q1:
-                st.caption("Source: Direct")
-                st.dataframe(
-                    df_queries_all[df_queries_all['Source'] == 'Direct']
-                    .sort_values(by='Clicks', ascending=False)
-                    .head(10)[['Top queries', 'Clicks', 'Impressions', 'CTR', 'Position']],
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-            with col_q2:
-                st.caption("Source: Collection")
-                st.dataframe(
-                    df_queries_all[df_queries_all['Source'] == 'Collection']
-                    .sort_values(by='Clicks', ascending=False)
-                    .head(10)[['Top queries', 'Clicks', 'Impressions', 'CTR', 'Position']],
-                    use_container_width=True,
-                    hide_index=True
-                )
+with tab_search:
+    if tab_search.open:
+        search_section(start_date, end_date)
 
-        # Top Pages Table
-        if not df_pages_all.empty:
-            st.subheader("Top Landing Pages (by Clicks)")
-            col_p1, col_p2 = st.columns(2)
-            
-            with col_p1:
-                st.caption("Source: Direct")
-                st.dataframe(
-                    df_pages_all[df_pages_all['Source'] == 'Direct']
-                    .sort_values(by='Clicks', ascending=False)
-                    .head(10)[['Top pages', 'Clicks', 'Impressions', 'CTR', 'Position']],
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-            with col_p2:
-                st.caption("Source: Collection")
-                st.dataframe(
-                    df_pages_all[df_pages_all['Source'] == 'Collection']
-                    .sort_values(by='Clicks', ascending=False)
-                    .head(10)[['Top pages', 'Clicks', 'Impressions', 'CTR', 'Position']],
-                    use_container_width=True,
-                    hide_index=True
-                )
+with tab_products:
+    if tab_products.open:
+        product_section(start_date, end_date)
 
-else:
-    st.warning(f"GSC Data directories not found. Expected at: `{PATH_DIRECT}` and `{PATH_COLLECTION}`")
+with tab_gsc:
+    if tab_gsc.open:
+        gsc_section()
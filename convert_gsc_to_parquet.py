@@ -0,0 +1,40 @@
+"""
+Converts the local Google Search Console CSV exports to Parquet.
+
+app.py prefers a `.parquet` file over the `.csv` of the same name, so run this
+once after dropping a fresh GSC export into one of the data directories:
+
+    python convert_gsc_to_parquet.py
+"""
+import os
+import pandas as pd
+from gsc_data import downcast_gsc_frame, load_gsc_csv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GSC_DIRS = ["Pulex-Bucket-Direct", "Bucket-Collection"]
+GSC_FILES = ["Chart.csv", "Queries.csv", "Pages.csv"]
+CATEGORY_COLUMNS = ["Top queries", "Top pages"]
+
+def prepare_gsc_frame(path):
+    # Same parsing and 32-bit types as the dashboard, so loading the Parquet needs no conversion
+    df = downcast_gsc_frame(load_gsc_csv(path))
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def main():
+    for directory in GSC_DIRS:
+        for filename in GSC_FILES:
+            path = os.path.join(BASE_DIR, directory, filename)
+            if not os.path.exists(path):
+                print(f"Skipping missing file: {path}")
+                continue
+            parquet_path = os.path.splitext(path)[0] + '.parquet'
+            prepare_gsc_frame(path).to_parquet(parquet_path, engine='pyarrow', compression='zstd')
+            print(f"Wrote {parquet_path}")
+
+if __name__ == "__main__":
+    main()
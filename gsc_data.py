@@ -0,0 +1,57 @@
+"""
+Shared parsing for the local Google Search Console CSV exports.
+
+Used by app.py to read the CSVs and by convert_gsc_to_parquet.py so the Parquet
+copies are written with the same column types the dashboard expects.
+"""
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
+
+# GSC exports CTR as a percentage string (e.g. "0.19%"); downcast_gsc_frame parses it.
+# Text columns are declared as string so a non-UTF-8 file raises (and falls back to
+# latin1) instead of being silently inferred as binary.
+GSC_COLUMN_TYPES = {
+    'Top queries': pa.string(),
+    'Top pages': pa.string(),
+    'Clicks': pa.int32(),
+    'Impressions': pa.int32(),
+    'CTR': pa.string(),
+    'Position': pa.float32()
+}
+
+# GSC counts stay well below 2**31, so 32-bit columns halve memory without loss
+GSC_NUMERIC_DTYPES = {
+    'Clicks': 'int32',
+    'Impressions': 'int32',
+    'CTR': 'float32',
+    'Position': 'float32'
+}
+
+def downcast_gsc_frame(df):
+    if 'CTR' in df.columns and not pd.api.types.is_numeric_dtype(df['CTR']):
+        # Days without impressions export an empty CTR, which becomes NaN
+        df['CTR'] = pd.to_numeric(df['CTR'].astype(str).str.rstrip('%'), errors='coerce')
+    # An empty Clicks/Impressions cell means nothing was recorded; int32 cannot hold NaN
+    for col in ('Clicks', 'Impressions'):
+        if col in df.columns:
+            df[col] = df[col].fillna(0)
+    return df.astype({col: dtype for col, dtype in GSC_NUMERIC_DTYPES.items() if col in df.columns})
+
+def read_gsc_csv(path, encoding):
+    # Arrow's multithreaded reader with explicit types skips pandas' dtype inference
+    table = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(encoding=encoding),
+        convert_options=pacsv.ConvertOptions(column_types=GSC_COLUMN_TYPES)
+    )
+    return table.to_pandas()
+
+def load_gsc_csv(path):
+    try:
+        df = read_gsc_csv(path, 'utf8')
+    except Exception:
+        # Fallback to latin1 if utf-8 fails
+        df = read_gsc_csv(path, 'latin1')
+    df.columns = df.columns.str.strip()
+    return df
@@ -0,0 +1,69 @@
+-- Daily rollup of "Pulex Bucket" internal searches and product views.
+--
+-- app.py aggregates this table instead of scanning the raw `events_*` export
+-- shards on every dashboard load. Materialized views cannot be defined over
+-- wildcard tables, so this runs as a BigQuery scheduled query (daily). Each run
+-- rebuilds the trailing three days to pick up late-arriving events; for the
+-- initial backfill set `since` to the first export date (e.g. DATE '2023-01-01').
+
+DECLARE since DATE DEFAULT DATE_SUB(CURRENT_DATE(), INTERVAL 3 DAY);
+-- Shard bounds are computed once as constant strings so the _TABLE_SUFFIX
+-- predicate prunes the wildcard set before any shard is read.
+DECLARE first_suffix STRING DEFAULT FORMAT_DATE('%Y%m%d', since);
+DECLARE last_suffix STRING DEFAULT FORMAT_DATE('%Y%m%d', CURRENT_DATE());
+
+CREATE TABLE IF NOT EXISTS `analytics-473719.analytics_306941895.pulex_bucket_daily` (
+    d DATE,
+    kind STRING,
+    item_name STRING,
+    item_color STRING,
+    c INT64
+)
+PARTITION BY d
+CLUSTER BY kind, item_color, item_name;
+
+DELETE FROM `analytics-473719.analytics_306941895.pulex_bucket_daily`
+WHERE d >= since;
+
+INSERT INTO `analytics-473719.analytics_306941895.pulex_bucket_daily` (d, kind, item_name, item_color, c)
+SELECT
+    PARSE_DATE('%Y%m%d', event_date) as d,
+    'search' as kind,
+    CAST(NULL AS STRING) as item_name,
+    CAST(NULL AS STRING) as item_color,
+    COUNT(*) as c
+FROM
+    `analytics-473719.analytics_306941895.events_*`
+WHERE
+    _TABLE_SUFFIX BETWEEN first_suffix AND last_suffix
+    AND event_date BETWEEN first_suffix AND last_suffix
+    AND event_name = 'view_search_results'
+    AND CONTAINS_SUBSTR((SELECT value.string_value FROM UNNEST(event_params) WHERE key = 'search_term'), 'pulex bucket')
+GROUP BY 1
+
+UNION ALL
+
+SELECT
+    PARSE_DATE('%Y%m%d', event_date) as d,
+    'view' as kind,
+    item.item_name,
+    INITCAP(REGEXP_EXTRACT(item.item_name, r'(?i)\b(red|blue|green|gray)\b')) as item_color,
+    COUNT(*) as c
+FROM (
+    -- Project the items array down to item_name before unnesting so only that
+    -- struct field is read, not the whole items record
+    SELECT
+        event_date,
+        ARRAY(SELECT AS STRUCT item_name FROM UNNEST(items)) as items
+    FROM
+        `analytics-473719.analytics_306941895.events_*`
+    WHERE
+        _TABLE_SUFFIX BETWEEN first_suffix AND last_suffix
+        AND event_date BETWEEN first_suffix AND last_suffix
+        AND event_name = 'view_item'
+),
+    UNNEST(items) as item
+WHERE
+    CONTAINS_SUBSTR(item.item_name, 'pulex bucket')
+GROUP BY 1, 3, 4
+HAVING item_color IS NOT NULL;